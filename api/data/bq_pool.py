@@ -0,0 +1,40 @@
+import copy
+import os
+import threading
+from typing import List
+from google.cloud import bigquery
+
+# Region of the dataset; set so jobs don't pay for location auto-detection
+LOCATION = os.getenv("BQ_LOCATION", os.getenv("LOCATION", "US"))
+# Per-job cost ceiling; a query that would scan more fails instead of billing
+MAX_BYTES_BILLED = int(os.getenv("BQ_MAX_BYTES", "10000000000"))
+
+# Defaults shared by every job; get_job_config() hands out copies
+_JOB_TEMPLATE = bigquery.QueryJobConfig(
+    use_query_cache=True,
+    use_legacy_sql=False,
+    priority=bigquery.QueryPriority.INTERACTIVE,
+    maximum_bytes_billed=MAX_BYTES_BILLED,
+)
+
+_client: bigquery.Client | None = None
+_client_lock = threading.Lock()
+
+def get_client() -> bigquery.Client:
+    """
+    Process-wide BigQuery client (thread-safe), so its HTTP session and credentials are reused.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = bigquery.Client(location=LOCATION)
+    return _client
+
+def get_job_config(query_parameters: List) -> bigquery.QueryJobConfig:
+    """
+    Copy of the shared job defaults with this call's query parameters.
+    """
+    job_config = copy.deepcopy(_JOB_TEMPLATE)
+    job_config.query_parameters = query_parameters
+    return job_config
@@ -1,17 +1,26 @@
+import logging
 import os
-from typing import Dict, List
+from typing import Dict, List, Sequence, Tuple
 from google.cloud import bigquery
+from data import bq_pool
 
 # Environment variables with defaults
 PROJECT_ID = os.getenv("BQ_PROJECT", "n8n-ads-spend")
 DATASET    = os.getenv("BQ_DATASET", "ads_warehouse")
 TABLE      = os.getenv("BQ_TABLE", "ads_spend_raw")
 TABLE_FQN  = f"`{PROJECT_ID}.{DATASET}.{TABLE}`"
+# Materialized daily rollup of TABLE (see dbt/bq_ddl__ads_spend__daily_mv__v1.sql)
+DAILY_TABLE = os.getenv("BQ_DAILY_TABLE", "ads_spend_daily_mv")
+DAILY_FQN   = f"`{PROJECT_ID}.{DATASET}.{DAILY_TABLE}`"
+
+_log = logging.getLogger(__name__)
+# Named DATE parameters bound by compare_periods, in signature order
+_PARAM_NAMES = ("first_start", "first_end", "second_start", "second_end")
 
 class BigQueryRepository:
     def __init__(self, client: bigquery.Client | None = None):
-        # Reuse an injected client or create a new one
-        self.client = client or bigquery.Client()
+        # Reuse an injected client or the shared process-wide one
+        self.client = client or bq_pool.get_client()
 
     def compare_periods(
         self, first_start: str, first_end: str, second_start: str, second_end: str
@@ -20,38 +29,24 @@ class BigQueryRepository:
         Returns two rows (period in ['first','second']) with aggregated and derived metrics.
 
         Query breakdown:
-        - base: daily aggregation (spend, conversions, revenue)
-        - labelled: tag each day as 'first' or 'second' depending on the date range
-        - agg: roll up to the period level
+        - base: daily rows (spend, conversions, revenue) read from the materialized daily view
+        - agg: keep days inside either range, tag them 'first' or 'second' and roll up per period
         - final SELECT: calculate CAC (spend/conversions) and ROAS (revenue/spend)
         """
         sql = f"""
         WITH base AS (
-          SELECT DATE(date) AS dt,
-                 SUM(spend)       AS spend,
-                 SUM(conversions) AS conversions,
-                 SUM(revenue)     AS revenue
-          FROM {TABLE_FQN}
-          WHERE DATE(date) BETWEEN @first_start AND @second_end
-          GROUP BY dt
-        ),
-        labelled AS (
-          SELECT
-            dt, spend, conversions, revenue,
-            CASE
-              WHEN dt BETWEEN @first_start AND @first_end THEN 'first'
-              WHEN dt BETWEEN @second_start AND @second_end THEN 'second'
-            END AS period
-          FROM base
+          SELECT dt, spend, conversions, revenue
+          FROM {DAILY_FQN}
+          WHERE dt BETWEEN LEAST(@first_start, @second_start) AND GREATEST(@first_end, @second_end)
         ),
         agg AS (
           SELECT
-            period,
+            IF(dt BETWEEN @first_start AND @first_end, 'first', 'second') AS period,
             SUM(spend)       AS spend,
             SUM(conversions) AS conversions,
             SUM(revenue)     AS revenue
-          FROM labelled
-          WHERE period IS NOT NULL
+          FROM base
+          WHERE dt BETWEEN @first_start AND @first_end OR dt BETWEEN @second_start AND @second_end
           GROUP BY period
         )
         SELECT
@@ -59,20 +54,80 @@ class BigQueryRepository:
           spend,
           conversions,
           revenue,
-          SAFE_DIVIDE(spend, NULLIF(conversions,0)) AS CAC,
-          SAFE_DIVIDE(revenue, NULLIF(spend,0))     AS ROAS
+          SAFE_DIVIDE(spend, conversions) AS CAC,
+          SAFE_DIVIDE(revenue, spend)     AS ROAS
         FROM agg
         """
 
-        # Bind parameters safely
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("first_start",  "DATE", first_start),
-                bigquery.ScalarQueryParameter("first_end",    "DATE", first_end),
-                bigquery.ScalarQueryParameter("second_start", "DATE", second_start),
-                bigquery.ScalarQueryParameter("second_end",   "DATE", second_end),
-            ]
+        # Bind parameters safely; the SQL is deterministic, so repeated ranges hit the 24h results cache
+        job_config = bq_pool.get_job_config([
+            bigquery.ScalarQueryParameter(name, "DATE", value)
+            for name, value in zip(_PARAM_NAMES, (first_start, first_end, second_start, second_end))
+        ])
+
+        # Iterate the result directly; Row.items() pairs values with the schema positionally
+        job = self.client.query(sql, job_config=job_config, job_id_prefix="metrics-", location=bq_pool.LOCATION)
+        result = job.result()
+        _log.info("BQ job %s cache_hit=%s", job.job_id, job.cache_hit)
+        return [dict(r.items()) for r in result]
+
+    def compare_periods_many(self, specs: Sequence[Tuple[str, str, str, str]]) -> List[Dict]:
+        """
+        Same as compare_periods for several date ranges in a single BigQuery job.
+
+        specs holds (first_start, first_end, second_start, second_end) tuples. Each returned row
+        carries `qid`, the index of its spec, next to the compare_periods columns. The four
+        date lists are bound as ARRAY parameters and zipped by offset, so the SQL text is the
+        same for any batch size.
+        """
+        if not specs:
+            return []
+
+        sql = f"""
+        WITH specs AS (
+          SELECT
+            qid,
+            first_start,
+            @first_ends[OFFSET(qid)]    AS first_end,
+            @second_starts[OFFSET(qid)] AS second_start,
+            @second_ends[OFFSET(qid)]   AS second_end
+          FROM UNNEST(@first_starts) AS first_start WITH OFFSET AS qid
+        ),
+        agg AS (
+          SELECT
+            s.qid,
+            IF(b.dt BETWEEN s.first_start AND s.first_end, 'first', 'second') AS period,
+            SUM(b.spend)       AS spend,
+            SUM(b.conversions) AS conversions,
+            SUM(b.revenue)     AS revenue
+          FROM specs AS s
+          JOIN {DAILY_FQN} AS b
+            ON b.dt BETWEEN s.first_start AND s.first_end OR b.dt BETWEEN s.second_start AND s.second_end
+          WHERE b.dt BETWEEN @range_start AND @range_end  -- partition pruning across the batch
+          GROUP BY qid, period
         )
+        SELECT
+          qid,
+          period,
+          spend,
+          conversions,
+          revenue,
+          SAFE_DIVIDE(spend, conversions) AS CAC,
+          SAFE_DIVIDE(revenue, spend)     AS ROAS
+        FROM agg
+        """
+
+        columns = list(zip(*specs))
+        job_config = bq_pool.get_job_config([
+            bigquery.ArrayQueryParameter(f"{name}s", "DATE", list(values))
+            for name, values in zip(_PARAM_NAMES, columns)
+        ] + [
+            # Bounds over both ranges of every spec: a spec's second range may come before its first
+            bigquery.ScalarQueryParameter("range_start", "DATE", min(columns[0] + columns[2])),
+            bigquery.ScalarQueryParameter("range_end",   "DATE", max(columns[1] + columns[3])),
+        ])
 
-        rows = list(self.client.query(sql, job_config=job_config).result())
-        return [dict(r) for r in rows]
+        job = self.client.query(sql, job_config=job_config, job_id_prefix="metrics-batch-", location=bq_pool.LOCATION)
+        result = job.result()
+        _log.info("BQ job %s cache_hit=%s specs=%d", job.job_id, job.cache_hit, len(specs))
+        return [dict(r.items()) for r in result]
@@ -1,57 +1,103 @@
 from datetime import datetime, date, timedelta
 from typing import Dict, List, Optional
 import re, unicodedata
+from functools import lru_cache
+from urllib.parse import urlencode
 from dateutil.relativedelta import relativedelta
 
+# Compiled once at import (input is already lowercased and accent-stripped by _norm)
+_RE_LAST_DAYS  = re.compile(r'last (\d+) days?', re.ASCII)
+_RE_PRIOR_DAYS = re.compile(r'(prior|previous) (\d+) days?', re.ASCII)
+_RE_THIS_MONTH = re.compile(r'(this|este)\s+month', re.ASCII)
+_RE_LAST_MONTH = re.compile(r'last\s+month|mes pasado', re.ASCII)
+_RE_MONTH_VS   = re.compile(r'([a-z]+)\s+vs\s+([a-z]+)', re.ASCII)
+
+def _strip_marks(s:str)->str:
+    return ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
+
+# Lowercase Spanish/English accented letters -> base letter, applied in one str.translate call
+_NORM_TABLE = str.maketrans({c:_strip_marks(c) for c in 'áéíóúñüàèìòùâêîôûäëïöçãõ'})
+
 class NaturalLanguageToAPI:
     def __init__(self, tz_today: Optional[date]=None):
-        self.today = tz_today or datetime.now().date()
+        # Fixed "today" for tests/backfills; otherwise resolved per call so a long-lived instance rolls over
+        self._fixed_today = tz_today
         self.metric_mapping = {
             'cac':'CAC','roas':'ROAS','spend':'spend','conversions':'conversions','revenue':'revenue',
             'performance':'all','metrics':'all'
         }
+        # Single alternation over all keywords; mapping order still decides priority
+        self._metric_re = re.compile('|'.join(re.escape(k) for k in self.metric_mapping), re.ASCII)
+        self._metric_rank = {k:i for i,k in enumerate(self.metric_mapping)}
         self.months = {
             'january':1,'february':2,'march':3,'april':4,'may':5,'june':6,'july':7,'august':8,
             'september':9,'october':10,'november':11,'december':12,
             'enero':1,'febrero':2,'marzo':3,'abril':4,'mayo':5,'junio':6,'julio':7,'agosto':8,
             'septiembre':9,'setiembre':9,'octubre':10,'noviembre':11,'diciembre':12
         }
+        # Period signature produced by _extract_time_periods -> date range builder
+        self._date_param_handlers = {
+            ('last','days','prior','days'): self._days_params,
+            ('current','month','last','month'): self._current_month_params,
+            ('month',None,'month',None): self._named_months_params,
+            ('last','week','prior','week'): self._weeks_params,
+        }
+        # Parses are pure for a given (today, normalized question); keep them as immutable tuples
+        self._parse_cached = lru_cache(maxsize=2048)(self._parse)
+
+    @property
+    def today(self) -> date:
+        return self._fixed_today or datetime.now().date()
 
     def _norm(self, s:str)->str:
-        s = s.lower()
-        return ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
+        s = s.lower().translate(_NORM_TABLE)
+        # Anything outside the table (rare) still goes through the full NFD strip
+        return s if s.isascii() else _strip_marks(s)
 
     def parse_natural_language(self, question: str) -> Optional[Dict]:
-        q = self._norm(question)
-        metrics = self._extract_metrics(q)
-        time_periods = self._extract_time_periods(q)
-        if not time_periods:
+        # Case, accents and spacing don't change the parse, so near-identical questions share an entry
+        parsed = self._parse_cached(self.today, " ".join(self._norm(question).split()))
+        if parsed is None:
             return None
+        metrics, time_periods, api_params = parsed
+        # Fresh containers on every call so callers can't mutate the cached entry
         return {
-            "metrics": metrics,
-            "time_periods": time_periods,
-            "api_params": self._generate_date_params(time_periods),
+            "metrics": list(metrics),
+            "time_periods": [dict(p) for p in time_periods],
+            "api_params": dict(api_params),
             "endpoint": "/metrics/compare-periods"
         }
 
+    def _parse(self, today: date, q: str) -> Optional[tuple]:
+        metrics = self._extract_metrics(q)
+        time_periods = self._extract_time_periods(q)
+        if not time_periods:
+            return None
+        return (
+            tuple(metrics),
+            tuple(tuple(p.items()) for p in time_periods),
+            tuple(self._generate_date_params(time_periods, today).items()),
+        )
+
     def _extract_metrics(self, q: str):
-        if 'cac' in q and 'roas' in q: return ['CAC','ROAS']
-        for k,v in self.metric_mapping.items():
-            if k in q: return [v] if v!='all' else ['all']
-        return ['all']
+        found = set(self._metric_re.findall(q))
+        if not found: return ['all']
+        if 'cac' in found and 'roas' in found: return ['CAC','ROAS']
+        v = self.metric_mapping[min(found, key=self._metric_rank.__getitem__)]
+        return [v] if v!='all' else ['all']
 
     def _extract_time_periods(self, q: str):
         periods = []
-        m_last = re.search(r'last (\d+) days?', q)
-        m_prior = re.search(r'(prior|previous) (\d+) days?', q)
+        m_last = _RE_LAST_DAYS.search(q)
+        m_prior = _RE_PRIOR_DAYS.search(q)
         if m_last and m_prior and int(m_last.group(1)) == int(m_prior.group(2)):
             d = int(m_last.group(1))
             return [{"type":"last","value":d,"unit":"days"},{"type":"prior","value":d,"unit":"days"}]
 
-        if re.search(r'(this|este)\s+month', q) and re.search(r'last\s+month|mes pasado', q):
+        if _RE_THIS_MONTH.search(q) and _RE_LAST_MONTH.search(q):
             return [{"type":"current","unit":"month"},{"type":"last","unit":"month"}]
 
-        mv = re.search(r'([a-z]+)\s+vs\s+([a-z]+)', q)
+        mv = _RE_MONTH_VS.search(q)
         if mv and mv.group(1) in self.months and mv.group(2) in self.months:
             return [{"type":"month","value":mv.group(1)}, {"type":"month","value":mv.group(2)}]
 
@@ -64,44 +110,48 @@ class NaturalLanguageToAPI:
         end = (start + relativedelta(months=1)) - timedelta(days=1)
         return start, end
 
-    def _generate_date_params(self, time_periods):
-        today = self.today
-
-        if len(time_periods)==2 and all(p.get('unit')=='days' for p in time_periods):
-            days = time_periods[0]['value']
-            second_end = today
-            second_start = today - timedelta(days=days-1)
-            first_end = second_start - timedelta(days=1)
-            first_start = first_end - timedelta(days=days-1)
-            return {"first_start": first_start.isoformat(),"first_end": first_end.isoformat(),
-                    "second_start": second_start.isoformat(),"second_end": second_end.isoformat()}
-
-        if len(time_periods)==2 and time_periods[0].get('unit')=='month' and time_periods[0]['type']=='current':
-            cur_start, cur_end = self._month_range(today.year, today.month)
-            prev_date = cur_start - relativedelta(days=1)
-            last_start, last_end = self._month_range(prev_date.year, prev_date.month)
-            return {"first_start": last_start.isoformat(),"first_end": last_end.isoformat(),
-                    "second_start": cur_start.isoformat(),"second_end": min(cur_end, today).isoformat()}
-
-        if len(time_periods)==2 and all(p['type']=='month' for p in time_periods):
-            y = today.year
-            m1 = self.months[time_periods[0]['value']]; m2 = self.months[time_periods[1]['value']]
-            s1,e1 = self._month_range(y, m1); s2,e2 = self._month_range(y, m2)
-            return {"first_start": s1.isoformat(),"first_end": e1.isoformat(),
-                    "second_start": s2.isoformat(),"second_end": e2.isoformat()}
-
-        if len(time_periods)==2 and all(p.get('unit')=='week' for p in time_periods):
-            end_last = today - timedelta(days=1)
-            start_last = end_last - timedelta(days=6)
-            end_prior = start_last - timedelta(days=1)
-            start_prior = end_prior - timedelta(days=6)
-            return {"first_start": start_prior.isoformat(),"first_end": end_prior.isoformat(),
-                    "second_start": start_last.isoformat(),"second_end": end_last.isoformat()}
-        return {}
+    def _generate_date_params(self, time_periods, today: date):
+        # Dispatch on the (type, unit) signature of the two periods
+        if len(time_periods)!=2: return {}
+        p0, p1 = time_periods
+        handler = self._date_param_handlers.get((p0['type'], p0.get('unit'), p1['type'], p1.get('unit')))
+        return handler(time_periods, today) if handler else {}
+
+    def _days_params(self, time_periods, today):
+        days = time_periods[0]['value']
+        second_end = today
+        second_start = today - timedelta(days=days-1)
+        first_end = second_start - timedelta(days=1)
+        first_start = first_end - timedelta(days=days-1)
+        return {"first_start": first_start.isoformat(),"first_end": first_end.isoformat(),
+                "second_start": second_start.isoformat(),"second_end": second_end.isoformat()}
+
+    def _current_month_params(self, time_periods, today):
+        cur_start, cur_end = self._month_range(today.year, today.month)
+        prev_date = cur_start - relativedelta(days=1)
+        last_start, last_end = self._month_range(prev_date.year, prev_date.month)
+        return {"first_start": last_start.isoformat(),"first_end": last_end.isoformat(),
+                "second_start": cur_start.isoformat(),"second_end": min(cur_end, today).isoformat()}
+
+    def _named_months_params(self, time_periods, today):
+        y = today.year
+        m1 = self.months[time_periods[0]['value']]; m2 = self.months[time_periods[1]['value']]
+        s1,e1 = self._month_range(y, m1); s2,e2 = self._month_range(y, m2)
+        return {"first_start": s1.isoformat(),"first_end": e1.isoformat(),
+                "second_start": s2.isoformat(),"second_end": e2.isoformat()}
+
+    def _weeks_params(self, time_periods, today):
+        end_last = today - timedelta(days=1)
+        start_last = end_last - timedelta(days=6)
+        end_prior = start_last - timedelta(days=1)
+        start_prior = end_prior - timedelta(days=6)
+        return {"first_start": start_prior.isoformat(),"first_end": end_prior.isoformat(),
+                "second_start": start_last.isoformat(),"second_end": end_last.isoformat()}
 
     def generate_api_url(self, question: str):
-        parsed = self.parse_natural_language(question)
+        return self.generate_api_url_from_parsed(self.parse_natural_language(question))
+
+    def generate_api_url_from_parsed(self, parsed: Optional[Dict]):
+        # Callers that already hold parse_natural_language()'s result skip the second parse
         if not parsed or not parsed['api_params']: return None
-        p = parsed['api_params']
-        base = "http://localhost:8000/metrics/compare-periods"
-        return f"{base}?first_start={p['first_start']}&first_end={p['first_end']}&second_start={p['second_start']}&second_end={p['second_end']}"
+        return f"http://localhost:8000{parsed['endpoint']}?{urlencode(parsed['api_params'])}"
@@ -1,12 +1,30 @@
 # api/main.py
-from datetime import datetime
-from fastapi import FastAPI, HTTPException, Query
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from fastapi import FastAPI, Header, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
+import asyncio
+import hashlib
+import hmac
 import logging
 import os
+import re
 import subprocess
-from pathlib import Path
+import threading
+import time
+from cachetools import TLRUCache, TTLCache
+import google.auth
+from google.auth.exceptions import DefaultCredentialsError
+from google.auth.transport.requests import Request as GoogleAuthRequest
+import httpx
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from routers import nlq, metrics
+# Region (BQ_LOCATION / LOCATION) and per-query cost ceiling shared with the repository layer
+from data.bq_pool import LOCATION, MAX_BYTES_BILLED
 from typing import List
 from pydantic import BaseModel, Field, constr, confloat, conint
 
@@ -15,10 +33,13 @@ PREDICT_CF_URL = os.getenv(
     "https://us-central1-n8n-ads-spend.cloudfunctions.net/predict_roas"
 )
 PREDICT_API_KEY = os.getenv("PREDICT_API_KEY", "") 
+# Shared secret for /admin/* (sent by n8n as X-Admin-Token); admin routes are disabled while unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 
 # ------------ App & Logging ------------
 logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
-app = FastAPI(title="metrics-api")
+_log = logging.getLogger(__name__)
+app = FastAPI(title="metrics-api", default_response_class=ORJSONResponse)
 app.include_router(nlq.router)
 app.include_router(metrics.router)
 
@@ -30,71 +51,199 @@ N8N_WEBHOOK_URL = "http://34.171.79.204/webhook-test/d788d010-a7da-4e1d-ad89-add
 PROJECT_ID = os.getenv("PROJECT_ID", "n8n-ads-spend")
 DATASET    = os.getenv("BQ_DATASET", "ads_warehouse")
 TABLE      = os.getenv("BQ_TABLE", "ads_spend_raw")
-LOCATION   = os.getenv("LOCATION", "US")  # IMPORTANT: region of your dataset (e.g., US, EU)
-BQ_QUERY_URL = f"https://bigquery.googleapis.com/bigquery/v2/projects/{PROJECT_ID}/queries"
-METADATA_TOKEN_URL = "http://metadata/computeMetadata/v1/instance/service-accounts/default/token"
+DAILY_TABLE = os.getenv("BQ_DAILY_TABLE", "ads_spend_daily_mv")  # materialized daily rollup of TABLE
+BQ_API_BASE  = f"https://bigquery.googleapis.com/bigquery/v2/projects/{PROJECT_ID}"
+BQ_QUERY_URL = f"{BQ_API_BASE}/queries"
+BQ_TABLE_URL = f"{BQ_API_BASE}/datasets/{DATASET}/tables/{TABLE}"
+METADATA_ROOT_URL  = "http://metadata/computeMetadata/v1/"
+METADATA_TOKEN_URL = f"{METADATA_ROOT_URL}instance/service-accounts/default/token"
+
+# ------------ Response caches ------------
+# Table metadata only changes on ingest; the n8n workflow calls POST /admin/invalidate after loading data
+_months_cache = TTLCache(maxsize=4, ttl=int(os.getenv("MONTHS_CACHE_TTL", "300")))
+_exists_cache = TTLCache(maxsize=4, ttl=int(os.getenv("EXISTS_CACHE_TTL", "3600")))
+# /metrics payloads keyed by the four dates; closed days only move on ingest, but ranges that
+# reach today are still filling up and get a much shorter lifetime
+METRICS_CACHE_TTL = int(os.getenv("METRICS_CACHE_TTL", "900"))
+METRICS_LIVE_TTL = int(os.getenv("METRICS_LIVE_TTL", "60"))
+
+def _is_live_range(dates: tuple) -> bool:
+    # A range is still filling up while any of its dates is today or later
+    return max(dates) >= date.today().isoformat()
+
+def _metrics_ttl(dates: tuple) -> int:
+    return METRICS_LIVE_TTL if _is_live_range(dates) else METRICS_CACHE_TTL
+
+# Entries are (payload, etag); the ETag is a hash of the payload itself, so it changes with the data
+_metrics_cache = TLRUCache(maxsize=256, ttu=lambda key, value, now: now + _metrics_ttl(key))
+# Fill the metadata caches right after startup so the first dashboard hit doesn't pay for them
+WARM_CACHES_ON_STARTUP = os.getenv("WARM_CACHES_ON_STARTUP", "").lower() in ("1", "true", "yes")
+
+# ------------ HTTP sessions ------------
+# Pooled keep-alive connections so TCP/TLS setup is paid once per host, not once per call.
+# Only connection failures are retried (read=0): n8n webhooks are GETs with side effects.
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=50, max_retries=Retry(total=2, read=0, backoff_factor=0.2))
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+
+# Metadata server: no retries, so local dev fails fast
+_metadata_session = requests.Session()
+_metadata_session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=10, max_retries=0))
+
+# Async client for the BigQuery and n8n endpoints: requests wait on the event loop instead of
+# holding a threadpool worker, and HTTP/2 multiplexes concurrent BigQuery calls on one connection.
+# Limits are per process; keep instances * HTTP_MAX_CONNECTIONS under the BigQuery API quota.
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "25"))
+
+@app.on_event("startup")
+async def open_http_client():
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(30.0, connect=2.0),
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=20),
+    )
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await app.state.http.aclose()
 
 # ------------ Auth helpers ------------
-def _metadata_token_available() -> bool:
+def _metadata_server_reachable() -> bool:
+    """
+    One-shot probe run at startup (see detect_gcp); the answer can't change while the process lives.
+    """
     try:
-        r = requests.get(METADATA_TOKEN_URL, headers={"Metadata-Flavor": "Google"}, timeout=1.5)
+        r = _metadata_session.get(METADATA_ROOT_URL, headers={"Metadata-Flavor": "Google"}, timeout=(0.5, 1.0))
         return r.status_code == 200
     except requests.RequestException:
         return False
 
+@app.on_event("startup")
+async def detect_gcp():
+    app.state.on_gcp = await run_in_threadpool(_metadata_server_reachable)
+    logging.info("Metadata server %s", "reachable" if app.state.on_gcp else "unavailable; using local credentials")
+
+# Tokens live ~1h; reuse them until shortly before expiry instead of fetching per request
+DEFAULT_TOKEN_TTL_SEC = 3300   # used when the token source doesn't report expiry
+BQ_SCOPES = ["https://www.googleapis.com/auth/bigquery"]
+TOKEN_EXPIRY_MARGIN_SEC = 60
+_token_cache = {"token": None, "exp": 0.0, "source": None}
+_token_lock = threading.Lock()
+_adc_credentials = None   # google.auth credentials, loaded on first local token fetch
+# Last resort for machines with a gcloud login but no ADC file (forks a CLI, so opt-in only)
+GCLOUD_TOKEN_FALLBACK = os.getenv("GCLOUD_TOKEN_FALLBACK", "").lower() in ("1", "true", "yes")
+
 def get_access_token() -> str:
     """
-    Order:
-      1) Metadata server (Cloud Run / GCE)
-      2) Local dev: gcloud auth print-access-token
-      3) If SA JSON is present, suggest using google-auth (we keep REST sample minimal)
+    Cached access token; refreshed under a lock so concurrent requests fetch it only once.
+    """
+    if time.monotonic() < _token_cache["exp"] - TOKEN_EXPIRY_MARGIN_SEC:
+        return _token_cache["token"]
+    with _token_lock:
+        if time.monotonic() < _token_cache["exp"] - TOKEN_EXPIRY_MARGIN_SEC:
+            return _token_cache["token"]
+        token, ttl, source = _fetch_access_token()
+        _token_cache.update(token=token, exp=time.monotonic() + ttl, source=source)
+        return token
+
+def _fetch_access_token() -> tuple[str, float, str]:
+    """
+    Returns (token, ttl_seconds, source). Order:
+      1) Metadata server (Cloud Run / GCE) - skipped when the startup probe found none
+      2) Local dev: Application Default Credentials via google-auth, in-process
+         (gcloud user login or GOOGLE_APPLICATION_CREDENTIALS service-account JSON)
+      3) If GCLOUD_TOKEN_FALLBACK is set: gcloud auth print-access-token
     """
-    if _metadata_token_available():
+    global _adc_credentials
+    r = None
+    # Unknown (startup hasn't run yet) counts as "try it"
+    if getattr(app.state, "on_gcp", True):
         try:
-            r = requests.get(METADATA_TOKEN_URL, headers={"Metadata-Flavor": "Google"}, timeout=3)
-            r.raise_for_status()
-            return r.json()["access_token"]
+            r = _metadata_session.get(METADATA_TOKEN_URL, headers={"Metadata-Flavor": "Google"}, timeout=(0.5, 2.0))
+        except requests.RequestException:
+            pass
+    if r is not None and r.status_code == 200:
+        try:
+            data = r.json()
+            return data["access_token"], float(data.get("expires_in", DEFAULT_TOKEN_TTL_SEC)), "metadata"
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Metadata token error: {e}")
 
+    try:
+        if _adc_credentials is None:
+            _adc_credentials, _ = google.auth.default(scopes=BQ_SCOPES)
+        if not _adc_credentials.valid:
+            _adc_credentials.refresh(GoogleAuthRequest(_session))
+    except DefaultCredentialsError:
+        if GCLOUD_TOKEN_FALLBACK:
+            return _gcloud_access_token()
+        raise HTTPException(status_code=500, detail="No access token available (metadata & application default credentials both unavailable).")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Credentials refresh error: {e}")
+
+    ttl = DEFAULT_TOKEN_TTL_SEC
+    if _adc_credentials.expiry:
+        # google-auth reports expiry as naive UTC
+        ttl = (_adc_credentials.expiry - datetime.now(timezone.utc).replace(tzinfo=None)).total_seconds()
+    return _adc_credentials.token, ttl, "adc/local"
+
+def _gcloud_access_token() -> tuple[str, float, str]:
     try:
         token = subprocess.check_output(["gcloud", "auth", "print-access-token"], text=True, timeout=5).strip()
-        if token:
-            return token
-    except Exception:
-        pass
-
-    cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "")
-    if cred_path and Path(cred_path).exists():
-        raise HTTPException(
-            status_code=500,
-            detail=("GOOGLE_APPLICATION_CREDENTIALS detected. This sample uses REST with metadata/gcloud tokens. "
-                    "Either run on Cloud Run/VM or switch to google-auth libraries for SA JSON."))
-    raise HTTPException(status_code=500, detail="No access token available (metadata & gcloud both unavailable).")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"gcloud token error: {e}")
+    if not token:
+        raise HTTPException(status_code=500, detail="gcloud returned an empty access token")
+    # gcloud doesn't report expiry
+    return token, DEFAULT_TOKEN_TTL_SEC, "gcloud"
 
 # ------------ BigQuery helper ------------
-def run_bq_query(sql: str, timeout_sec: int = 30) -> dict:
+@lru_cache(maxsize=64)
+def _one_line(sql: str) -> str:
+    # Log form of a query; the SQL constants are module-level, so this runs once per query text
+    return " ".join(sql.split())
+
+def bq_param(name: str, type_: str, value) -> dict:
+    """
+    Named scalar parameter in the Jobs: query REST format (e.g. bq_param("first_start", "DATE", "2025-05-01")).
+    """
+    return {"name": name, "parameterType": {"type": type_}, "parameterValue": {"value": str(value)}}
+
+async def run_bq_query(sql: str, timeout_sec: int = 30, query_parameters: List[dict] | None = None) -> dict:
     """
     Run a synchronous BigQuery query (Jobs: query). Adds 'location' to avoid region errors.
+    Values should be bound through query_parameters: the SQL text then stays identical across
+    requests, so BigQuery can serve repeated calls from its results cache.
     """
-    token = get_access_token()
+    # Token refresh may block (metadata GET / credentials refresh), so keep it off the event loop
+    token = await run_in_threadpool(get_access_token)
     headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
     body = {
         "query": sql,
         "useLegacySql": False,
+        "useQueryCache": True,
         "location": LOCATION,  # many errors are caused by missing location
+        "maximumBytesBilled": str(MAX_BYTES_BILLED),
     }
-    logging.info("BQ Query (location=%s): %s", LOCATION, " ".join(sql.split()))
+    if query_parameters:
+        body["parameterMode"] = "NAMED"
+        body["queryParameters"] = query_parameters
+    if _log.isEnabledFor(logging.INFO):
+        _log.info("BQ Query (location=%s): %s", LOCATION, _one_line(sql))
     try:
-        resp = requests.post(BQ_QUERY_URL, headers=headers, json=body, timeout=timeout_sec)
+        resp = await app.state.http.post(BQ_QUERY_URL, headers=headers, json=body, timeout=timeout_sec)
         if resp.status_code >= 400:
             raise HTTPException(status_code=502, detail=f"BigQuery HTTP {resp.status_code}: {resp.text[:1000]}")
-        data = resp.json()
+        data = orjson.loads(resp.content)
         # If BigQuery returns an error payload even with 200 (rare), surface it:
         if "error" in data:
             raise HTTPException(status_code=502, detail=f"BigQuery error payload: {data['error']}")
+        if _log.isEnabledFor(logging.INFO):
+            _log.info("BQ job %s cacheHit=%s bytesProcessed=%s",
+                      data.get("jobReference", {}).get("jobId"), data.get("cacheHit"), data.get("totalBytesProcessed"))
         return data
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=502, detail=f"BigQuery request failed: {e}")
 
 # ------------ Basic routes ------------
@@ -108,10 +257,10 @@ def health():
 
 # ------------ n8n trigger (GET with params) ------------
 @app.get("/trigger-n8n")
-def trigger_n8n(insertId: str = Query(...), amount: float = Query(...)):
+async def trigger_n8n(insertId: str = Query(...), amount: float = Query(...)):
     params = {"insertId": insertId, "amount": amount}
     try:
-        resp = requests.get(N8N_WEBHOOK_URL, params=params, timeout=10)
+        resp = await app.state.http.get(N8N_WEBHOOK_URL, params=params, timeout=10)
         resp.raise_for_status()
         ct = resp.headers.get("content-type", "")
         return {
@@ -119,186 +268,176 @@ def trigger_n8n(insertId: str = Query(...), amount: float = Query(...)):
             "forwarded_params": params,
             "n8n_response": resp.json() if ct.startswith("application/json") else resp.text,
         }
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logging.error("Error calling n8n webhook: %s", e)
         raise HTTPException(status_code=502, detail=f"n8n unreachable: {e}")
 
 # ------------ Diagnostics ------------
 @app.get("/_diag/token")
-def diag_token():
-    src = "metadata" if _metadata_token_available() else "gcloud/local"
+async def diag_token():
     try:
-        token = get_access_token()
-        return {"ok": True, "source": src, "token_prefix": token[:12] + "..."}
+        token = await run_in_threadpool(get_access_token)
+        return {"ok": True, "source": _token_cache["source"], "token_prefix": token[:12] + "..."}
     except HTTPException as e:
         raise e
 
 @app.get("/_diag/bq")
-def diag_bq():
+async def diag_bq():
     sql = "SELECT 1 AS ok"
-    return run_bq_query(sql)
+    return await run_bq_query(sql)
 
 @app.get("/bq/exists")
-def bq_exists():
-    sql = f"""
-    SELECT table_name
-    FROM `{PROJECT_ID}.{DATASET}.INFORMATION_SCHEMA.TABLES`
-    WHERE table_name = '{TABLE}'
+async def bq_exists():
+    """
+    Table lookup via tables.get: a metadata read, so no query job and no bytes billed.
     """
-    return run_bq_query(sql)
+    cached = _exists_cache.get(TABLE)
+    if cached is not None:
+        return cached
+    token = await run_in_threadpool(get_access_token)
+    try:
+        resp = await app.state.http.get(BQ_TABLE_URL, headers={"Authorization": f"Bearer {token}"},
+                                        params={"fields": "id,type,numRows,timePartitioning"})
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"BigQuery request failed: {e}")
+    if resp.status_code == 404:
+        result = {"exists": False, "table": f"{PROJECT_ID}.{DATASET}.{TABLE}"}
+    elif resp.status_code >= 400:
+        raise HTTPException(status_code=502, detail=f"BigQuery HTTP {resp.status_code}: {resp.text[:1000]}")
+    else:
+        result = {"exists": True, "table": f"{PROJECT_ID}.{DATASET}.{TABLE}", **resp.json()}
+    _exists_cache[TABLE] = result
+    return result
+
+@app.post("/admin/invalidate")
+def invalidate_caches(x_admin_token: str | None = Header(None)):
+    """
+    Drop cached table metadata and metric results. Called by the ingestion workflow.
+    Requires X-Admin-Token to match ADMIN_TOKEN (the service itself is publicly reachable).
+    """
+    if not ADMIN_TOKEN or not hmac.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    _months_cache.clear()
+    _exists_cache.clear()
+    _metrics_cache.clear()
+    return {"ok": True, "invalidated": ["months-available", "bq-exists", "metrics"]}
 
 # ------------ Metrics: CAC & ROAS ------------
+_ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}", re.ASCII)
+
+@lru_cache(maxsize=512)
+def _is_iso_date(s: str) -> bool:
+    """
+    Strict YYYY-MM-DD that is also a real calendar date (so bad input is a 400, not a BigQuery error).
+    """
+    if not _ISO_DATE.fullmatch(s):
+        return False
+    try:
+        date.fromisoformat(s)
+    except ValueError:
+        return False
+    return True
+
+def _ratio(num: float, den: float) -> float | None:
+    return num / den if den else None
+
+def _round2(value: float | None) -> float | None:
+    return round(value, 2) if value is not None else None
+
+def _pct_delta(new: float | None, old: float | None) -> float | None:
+    """
+    Period-over-period change in percent, rounded to 2 decimals (None when there is no baseline).
+    """
+    if new is None or not old:
+        return None
+    return round((new - old) / old * 100, 2)
+
+# Named parameters of COMPARE_PERIODS_SQL, in the same order as the /metrics cache key
+COMPARE_PERIODS_PARAMS = ("first_start", "first_end", "second_start", "second_end")
+
+# Built once at import: only table names are interpolated, dates are query parameters.
+# BigQuery only rolls days up to one row per period; pivot + derived metrics are done in Python.
+COMPARE_PERIODS_SQL = f"""
+SELECT
+  IF(dt BETWEEN @first_start AND @first_end, 'first', 'second') AS period,
+  SUM(spend)       AS spend,
+  SUM(conversions) AS conversions,
+  SUM(revenue)     AS revenue
+FROM `{PROJECT_ID}.{DATASET}.{DAILY_TABLE}`
+WHERE dt BETWEEN LEAST(@first_start, @second_start) AND GREATEST(@first_end, @second_end)  -- partition pruning, either order
+  AND (dt BETWEEN @first_start AND @first_end OR dt BETWEEN @second_start AND @second_end)
+GROUP BY period
+"""
+
+# entity-tag = [ "W/" ] DQUOTE *etagc DQUOTE (RFC 9110 8.8.3); etagc may include commas
+_ENTITY_TAG = re.compile(r'(?:W/)?"([^"]*)"')
+
+def _payload_etag(payload: dict) -> str:
+    return '"' + hashlib.blake2b(orjson.dumps(payload), digest_size=8).hexdigest() + '"'
+
+def _if_none_match(header: str | None, etag: str) -> bool:
+    """
+    If-None-Match evaluation (RFC 9110 13.1.2): "*" or any listed tag equal under weak comparison.
+    """
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag.strip('"') in _ENTITY_TAG.findall(header)
+
 @app.get("/metrics")
-def compare_periods(
+async def compare_periods(
+    response: Response,
     first_start: str = Query(..., description="Start date of first period (YYYY-MM-DD)"),
     first_end: str = Query(..., description="End date of first period (YYYY-MM-DD)"),
     second_start: str = Query(..., description="Start date of second period (YYYY-MM-DD)"),
-    second_end: str = Query(..., description="End date of second period (YYYY-MM-DD)")
+    second_end: str = Query(..., description="End date of second period (YYYY-MM-DD)"),
+    if_none_match: str | None = Header(None),
 ):
     """
     Compare two custom periods with CAC and ROAS metrics including deltas
     Example: /metrics/compare-periods?first_start=2025-05-01&first_end=2025-05-31&second_start=2025-06-01&second_end=2025-06-30
     """
     # Validate date formats
-    try:
-        first_start_dt = datetime.strptime(first_start, "%Y-%m-%d").date()
-        first_end_dt = datetime.strptime(first_end, "%Y-%m-%d").date()
-        second_start_dt = datetime.strptime(second_start, "%Y-%m-%d").date()
-        second_end_dt = datetime.strptime(second_end, "%Y-%m-%d").date()
-    except ValueError:
+    if not all(map(_is_iso_date, (first_start, first_end, second_start, second_end))):
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
     
-    # Validate date ranges
-    if first_start_dt > first_end_dt:
+    # Validate date ranges (YYYY-MM-DD strings order the same as the dates they encode)
+    if first_start > first_end:
         raise HTTPException(status_code=400, detail="First period start must be before end")
-    if second_start_dt > second_end_dt:
+    if second_start > second_end:
         raise HTTPException(status_code=400, detail="Second period start must be before end")
 
-    # Build dynamic query
-    sql = f"""
-WITH base AS (
-  SELECT
-    DATE(date) AS dt,
-    SUM(spend) AS spend,
-    SUM(conversions) AS conv,
-    CASE 
-      WHEN DATE(date) BETWEEN '{first_start_dt}' AND '{first_end_dt}' THEN 'first_period'
-      WHEN DATE(date) BETWEEN '{second_start_dt}' AND '{second_end_dt}' THEN 'second_period'
-      ELSE 'other'
-    END AS period
-  FROM `{PROJECT_ID}.{DATASET}.{TABLE}`
-  WHERE DATE(date) BETWEEN '{first_start_dt}' AND '{second_end_dt}'
-  GROUP BY dt, period
-),
-agg AS (
-  SELECT
-    period,
-    SUM(spend) AS spend,
-    SUM(conv) AS conv
-  FROM base
-  WHERE period IN ('first_period', 'second_period')
-  GROUP BY period
-),
-periods AS (
-  SELECT 'first_period' AS period UNION ALL SELECT 'second_period'
-),
-filled AS (
-  SELECT
-    p.period,
-    IFNULL(a.spend, 0) AS spend,
-    IFNULL(a.conv, 0) AS conv,
-    IFNULL(a.conv, 0) * 100 AS revenue,
-    SAFE_DIVIDE(IFNULL(a.spend, 0), NULLIF(IFNULL(a.conv, 0), 0)) AS CAC,
-    SAFE_DIVIDE(IFNULL(a.conv, 0) * 100, NULLIF(IFNULL(a.spend, 0), 0)) AS ROAS
-  FROM periods p
-  LEFT JOIN agg a USING (period)
-),
-pivoted AS (
-  SELECT
-    MAX(IF(period='second_period', spend, NULL)) AS spend_second,
-    MAX(IF(period='first_period', spend, NULL)) AS spend_first,
-    MAX(IF(period='second_period', conv, NULL)) AS conv_second,
-    MAX(IF(period='first_period', conv, NULL)) AS conv_first,
-    MAX(IF(period='second_period', revenue, NULL)) AS revenue_second,
-    MAX(IF(period='first_period', revenue, NULL)) AS revenue_first,
-    MAX(IF(period='second_period', CAC, NULL)) AS CAC_second,
-    MAX(IF(period='first_period', CAC, NULL)) AS CAC_first,
-    MAX(IF(period='second_period', ROAS, NULL)) AS ROAS_second,
-    MAX(IF(period='first_period', ROAS, NULL)) AS ROAS_first
-  FROM filled
-)
-SELECT
-  spend_second,
-  spend_first,
-  conv_second,
-  conv_first,
-  revenue_second,
-  revenue_first,
-  ROUND(CAC_second, 2) AS CAC_second,
-  ROUND(CAC_first, 2) AS CAC_first,
-  ROUND(ROAS_second, 2) AS ROAS_second,
-  ROUND(ROAS_first, 2) AS ROAS_first,
-  ROUND(SAFE_DIVIDE(spend_second - spend_first, NULLIF(spend_first, 0)) * 100, 2) AS spend_delta_pct,
-  ROUND(SAFE_DIVIDE(conv_second - conv_first, NULLIF(conv_first, 0)) * 100, 2) AS conversions_delta_pct,
-  ROUND(SAFE_DIVIDE(revenue_second - revenue_first, NULLIF(revenue_first, 0)) * 100, 2) AS revenue_delta_pct,
-  ROUND(SAFE_DIVIDE(CAC_second - CAC_first, NULLIF(CAC_first, 0)) * 100, 2) AS CAC_delta_pct,
-  ROUND(SAFE_DIVIDE(ROAS_second - ROAS_first, NULLIF(ROAS_first, 0)) * 100, 2) AS ROAS_delta_pct
-FROM pivoted
-    """
-
-    # Execute query
-    result = run_bq_query(sql)
-    
-    # Parse results
-    rows = result.get("rows", [])
-    if not rows:
-        return {
-            "periods": {
-                "first": {"start": first_start, "end": first_end},
-                "second": {"start": second_start, "end": second_end}
-            },
-            "metrics": {
-                "spend_first": 0,
-                "spend_second": 0,
-                "conversions_first": 0,
-                "conversions_second": 0,
-                "revenue_first": 0,
-                "revenue_second": 0,
-                "CAC_first": None,
-                "CAC_second": None,
-                "ROAS_first": None,
-                "ROAS_second": None
-            },
-            "deltas_pct": {
-                "spend": None,
-                "conversions": None,
-                "revenue": None,
-                "CAC": None,
-                "ROAS": None
-            }
-        }
-
-    # Extract values
-    row = rows[0]
-    fields = [f["name"] for f in result["schema"]["fields"]]
-    values = {field: row["f"][i]["v"] for i, field in enumerate(fields)}
-    
-    # Convert to appropriate data types
-    def safe_float(value):
-        return float(value) if value not in (None, "null") else None
-    
-    spend_second = safe_float(values.get("spend_second"))
-    spend_first = safe_float(values.get("spend_first"))
-    conv_second = safe_float(values.get("conv_second"))
-    conv_first = safe_float(values.get("conv_first"))
-    revenue_second = safe_float(values.get("revenue_second"))
-    revenue_first = safe_float(values.get("revenue_first"))
-    cac_second = safe_float(values.get("CAC_second"))
-    cac_first = safe_float(values.get("CAC_first"))
-    roas_second = safe_float(values.get("ROAS_second"))
-    roas_first = safe_float(values.get("ROAS_first"))
-
-    return {
+    # Let clients/proxies reuse the response for as long as we do, then revalidate via ETag.
+    # 304 is only answered from a live cache entry, whose tag was computed from the data it holds.
+    cache_key = (first_start, first_end, second_start, second_end)
+    cache_control = f"public, max-age={_metrics_ttl(cache_key)}"
+    response.headers["Cache-Control"] = cache_control
+    cached = _metrics_cache.get(cache_key)
+    if cached is not None:
+        payload, etag = cached
+        if _if_none_match(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+        response.headers["ETag"] = etag
+        return payload
+
+    # Execute query (dates bound as parameters)
+    result = await run_bq_query(COMPARE_PERIODS_SQL, query_parameters=[
+        bq_param(name, "DATE", value) for name, value in zip(COMPARE_PERIODS_PARAMS, cache_key)
+    ])
+
+    # Parse results: (period, spend, conversions, revenue) per row; missing periods count as zero
+    totals = {"first": (0.0, 0.0, 0.0), "second": (0.0, 0.0, 0.0)}
+    for row in result.get("rows", []):
+        period, *values = (c["v"] for c in row["f"])
+        totals[period] = tuple(float(v) if v is not None else 0.0 for v in values)
+
+    spend_first, conv_first, revenue_first = totals["first"]
+    spend_second, conv_second, revenue_second = totals["second"]
+    cac_first, cac_second = _ratio(spend_first, conv_first), _ratio(spend_second, conv_second)
+    roas_first, roas_second = _ratio(revenue_first, spend_first), _ratio(revenue_second, spend_second)
+
+    payload = {
         "periods": {
             "first": {"start": first_start, "end": first_end},
             "second": {"start": second_start, "end": second_end}
@@ -310,63 +449,65 @@ FROM pivoted
             "conversions_second": int(conv_second or 0),
             "revenue_first": revenue_first or 0,
             "revenue_second": revenue_second or 0,
-            "CAC_first": cac_first,
-            "CAC_second": cac_second,
-            "ROAS_first": roas_first,
-            "ROAS_second": roas_second
+            "CAC_first": _round2(cac_first),
+            "CAC_second": _round2(cac_second),
+            "ROAS_first": _round2(roas_first),
+            "ROAS_second": _round2(roas_second)
         },
         "deltas_pct": {
-            "spend": safe_float(values.get("spend_delta_pct")),
-            "conversions": safe_float(values.get("conversions_delta_pct")),
-            "revenue": safe_float(values.get("revenue_delta_pct")),
-            "CAC": safe_float(values.get("CAC_delta_pct")),
-            "ROAS": safe_float(values.get("ROAS_delta_pct"))
+            "spend": _pct_delta(spend_second, spend_first),
+            "conversions": _pct_delta(conv_second, conv_first),
+            "revenue": _pct_delta(revenue_second, revenue_first),
+            "CAC": _pct_delta(cac_second, cac_first),
+            "ROAS": _pct_delta(roas_second, roas_first)
         }
     }
+    etag = _payload_etag(payload)
+    _metrics_cache[cache_key] = (payload, etag)
+    response.headers["ETag"] = etag
+    return payload
 
-@app.get("/metadata/months-available")
-def get_available_months():
-    """
-    Get available months in the dataset with record counts
-    Returns list of months with start/end dates and record counts
-    """
-    sql = f"""
+MONTHS_AVAILABLE_SQL = f"""
 SELECT
-  DATE_TRUNC(DATE(date), MONTH) as data_month,
-  MIN(DATE(date)) as month_start,
-  MAX(DATE(date)) as month_end,
+  DATE_TRUNC(date, MONTH) as data_month,
+  MIN(date) as month_start,
+  MAX(date) as month_end,
   COUNT(*) as record_count
 FROM `{PROJECT_ID}.{DATASET}.{TABLE}`
 GROUP BY data_month
 ORDER BY data_month DESC
+"""
+
+@app.get("/metadata/months-available")
+async def get_available_months():
+    """
+    Get available months in the dataset with record counts
+    Returns list of months with start/end dates and record counts (cached, see _months_cache)
     """
+    cached = _months_cache.get("months")
+    if cached is not None:
+        return cached
 
     # Execute query
-    result = run_bq_query(sql)
+    result = await run_bq_query(MONTHS_AVAILABLE_SQL)
     
     # Parse results
     rows = result.get("rows", [])
-    months_data = []
-    
-    for row in rows:
-        fields = [f["name"] for f in result["schema"]["fields"]]
-        values = {field: row["f"][i]["v"] for i, field in enumerate(fields)}
-        
-        months_data.append({
-            "data_month": values["data_month"],
-            "month_start": values["month_start"],
-            "month_end": values["month_end"],
-            "record_count": int(values["record_count"])
-        })
-    
-    return {
+    fields = tuple(f["name"] for f in result["schema"]["fields"]) if rows else ()
+    months_data = [dict(zip(fields, (cell["v"] for cell in row["f"]))) for row in rows]
+    for m in months_data:
+        m["record_count"] = int(m["record_count"])
+
+    payload = {
         "available_months": months_data,
         "total_months": len(months_data)
-    }    
+    }
+    _months_cache["months"] = payload
+    return payload
 
 # ------------ n8n: simple trigger (GET only, params type) ------------
 @app.get("/trigger-n8n/simple")
-def trigger_n8n_simple(type: str = Query("test", description="Choose 'test' or 'prod'")):
+async def trigger_n8n_simple(type: str = Query("test", description="Choose 'test' or 'prod'")):
     """
     Call the n8n webhook directly.
     - type=test → calls /webhook-test/...
@@ -380,12 +521,12 @@ def trigger_n8n_simple(type: str = Query("test", description="Choose 'test' or '
         url = f"http://34.171.79.204/webhook-test/{webhook_id}"
 
     try:
-        r = requests.get(url, timeout=15)
+        r = await app.state.http.get(url, timeout=15)
         r.raise_for_status()
         ct = r.headers.get("content-type", "")
         payload = r.json() if ct and ct.startswith("application/json") else r.text
         return {"ok": True, "url": url, "mode": type, "method": "GET", "n8n_response": payload}
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logging.exception("n8n simple webhook error")
         raise HTTPException(status_code=502, detail=f"n8n unreachable: {e}")
 
@@ -414,7 +555,7 @@ def _call_predict_cf(payload: dict, timeout: int = 30) -> dict:
     if PREDICT_API_KEY:
         headers["x-api-key"] = PREDICT_API_KEY
     try:
-        r = requests.post(PREDICT_CF_URL, json=payload, headers=headers, timeout=timeout)
+        r = _session.post(PREDICT_CF_URL, json=payload, headers=headers, timeout=timeout)
         # La CF devuelve 400 con {"status":"error","message":"..."} para inputs inválidos
         if r.status_code >= 400:
             try:
@@ -434,7 +575,7 @@ def predict_single(item: PredictItem):
     """
     Single prediction. For multiple rows, use /ml/predict-batch.
     """
-    payload = item.dict()
+    payload = item.model_dump()
     data = _call_predict_cf(payload)
     preds = data.get("predictions")
     if not isinstance(preds, list):
@@ -446,14 +587,26 @@ def predict_batch(batch: PredictBatch):
     """
     Batch prediction using 'instances'.
     """
-    payload = {"instances": [i.dict() for i in batch.instances]}
+    payload = {"instances": [i.model_dump() for i in batch.instances]}
     data = _call_predict_cf(payload)
     preds = data.get("predictions")
     if not isinstance(preds, list) or len(preds) != len(batch.instances):
         raise HTTPException(status_code=502, detail=f"Unexpected CF response: {data}")
     return {"predictions": preds}
 
+# ------------ Startup ------------
+async def _warm_caches():
+    # Both lookups go out concurrently over the shared HTTP/2 connection
+    results = await asyncio.gather(bq_exists(), get_available_months(), return_exceptions=True)
+    for r in results:
+        if isinstance(r, Exception):
+            logging.warning("Cache warm-up failed: %s", getattr(r, "detail", r))
 
+@app.on_event("startup")
+async def warm_caches():
+    if WARM_CACHES_ON_STARTUP:
+        # Background task: don't hold up the container becoming ready
+        app.state.warmup = asyncio.create_task(_warm_caches())
 
 @app.on_event("startup")
 async def show_routes():
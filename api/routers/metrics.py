@@ -1,18 +1,31 @@
+from datetime import date
+from functools import lru_cache
 from fastapi import APIRouter, Query
+from fastapi.concurrency import run_in_threadpool
 from domain.models import ComparePeriodsQuery, ComparePeriodsResponse
 from services.metrics_service import MetricsService
 
 router = APIRouter(prefix="/metrics", tags=["metrics"])
 svc = MetricsService()
 
+@lru_cache(maxsize=64)
+def _parse_metrics(s: str) -> tuple[str, ...]:
+    # Clients send a handful of distinct values ("all", "CAC,ROAS", ...); parse each one once
+    return ("all",) if s.lower() == "all" else tuple(m.strip() for m in s.split(","))
+
 @router.get("/compare-periods", response_model=dict)  # o ComparePeriodsResponse si quieres tipado estricto
-def compare_periods(
-    first_start: str = Query(...),
-    first_end: str = Query(...),
-    second_start: str = Query(...),
-    second_end: str = Query(...),
+async def compare_periods(
+    first_start: date = Query(...),
+    first_end: date = Query(...),
+    second_start: date = Query(...),
+    second_end: date = Query(...),
     metrics: str = Query("all")  # "CAC,ROAS" o "all"
 ):
-    metrics_list = ["all"] if metrics.lower() == "all" else [m.strip() for m in metrics.split(",")]
-    data = svc.compare_periods(first_start, first_end, second_start, second_end, metrics_list)
+    # Dates were already parsed/validated by FastAPI (bad input is a 422 before any BigQuery work).
+    # The BigQuery client blocks until the job finishes; wait for it off the event loop
+    data = await run_in_threadpool(
+        svc.compare_periods,
+        first_start.isoformat(), first_end.isoformat(), second_start.isoformat(), second_end.isoformat(),
+        _parse_metrics(metrics),
+    )
     return data
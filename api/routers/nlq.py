@@ -1,4 +1,6 @@
+from typing import List
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from domain.models import NLQRequest
 from domain.nlq_mapper import NaturalLanguageToAPI
 from services.metrics_service import MetricsService
@@ -6,9 +8,11 @@ from services.metrics_service import MetricsService
 router = APIRouter(prefix="/nlq", tags=["nlq"])
 nl = NaturalLanguageToAPI()
 svc = MetricsService()
+# Upper bound on questions per /nlq/parse-batch call (one BigQuery job serves the whole batch)
+MAX_BATCH_SIZE = 50
 
 @router.post("/parse")
-def parse_and_run(req: NLQRequest):
+async def parse_and_run(req: NLQRequest):
     parsed = nl.parse_natural_language(req.question)
     if not parsed or not parsed.get("api_params"):
         raise HTTPException(status_code=400, detail="No se pudo interpretar periodos de tiempo en la pregunta.")
@@ -22,10 +26,11 @@ def parse_and_run(req: NLQRequest):
             "time_periods": parsed["time_periods"],
             "api_params": params,
             "endpoint": parsed["endpoint"],
-            "suggested_url": nl.generate_api_url(req.question)
+            "suggested_url": nl.generate_api_url_from_parsed(parsed)
         }
 
-    data = svc.compare_periods(
+    data = await run_in_threadpool(
+        svc.compare_periods,
         first_start=params["first_start"],
         first_end=params["first_end"],
         second_start=params["second_start"],
@@ -38,3 +43,44 @@ def parse_and_run(req: NLQRequest):
         "ranges": params,
         "result": data
     }
+
+@router.post("/parse-batch")
+async def parse_and_run_batch(reqs: List[NLQRequest]):
+    """
+    Same as /parse for several questions; all questions with execute=true share one BigQuery job.
+    Results come back in request order, and a question that can't be parsed gets an `error` entry
+    instead of failing the batch.
+    """
+    if len(reqs) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_BATCH_SIZE} preguntas por lote.")
+
+    out: List[dict] = []
+    pending = []  # (index in out, spec) for the questions to execute
+    for req in reqs:
+        parsed = nl.parse_natural_language(req.question)
+        if not parsed or not parsed.get("api_params"):
+            out.append({"question": req.question, "error": "No se pudo interpretar periodos de tiempo en la pregunta."})
+            continue
+
+        params = parsed["api_params"]
+        metrics = parsed["metrics"]
+        if not req.execute:
+            out.append({
+                "metrics": metrics,
+                "time_periods": parsed["time_periods"],
+                "api_params": params,
+                "endpoint": parsed["endpoint"],
+                "suggested_url": nl.generate_api_url_from_parsed(parsed)
+            })
+            continue
+
+        out.append({"question": req.question, "metrics": metrics, "ranges": params})
+        pending.append((len(out) - 1, (
+            params["first_start"], params["first_end"], params["second_start"], params["second_end"], metrics
+        )))
+
+    if pending:
+        results = await run_in_threadpool(svc.compare_periods_many, [spec for _, spec in pending])
+        for (i, _), data in zip(pending, results):
+            out[i]["result"] = data
+    return out
@@ -1,24 +1,38 @@
-from typing import List, Dict
+from typing import List, Dict, Sequence, Tuple
 from data.bq_repository import BigQueryRepository
 
 class MetricsService:
     def __init__(self, repo: BigQueryRepository | None = None):
         self.repo = repo or BigQueryRepository()
 
-    def compare_periods(self, first_start:str, first_end:str, second_start:str, second_end:str, metrics:List[str]) -> Dict:
+    def compare_periods(self, first_start:str, first_end:str, second_start:str, second_end:str, metrics:Sequence[str]) -> Dict:
         rows = self.repo.compare_periods(first_start, first_end, second_start, second_end)
+        return self._shape(rows, metrics)
+
+    def compare_periods_many(self, specs: Sequence[Tuple[str, str, str, str, Sequence[str]]]) -> List[Dict]:
+        # specs: (first_start, first_end, second_start, second_end, metrics); one BigQuery job for all
+        rows = self.repo.compare_periods_many([spec[:4] for spec in specs])
+        by_qid: Dict[int, List[Dict]] = {}
+        for r in rows:
+            by_qid.setdefault(r.pop("qid"), []).append(r)
+        return [self._shape(by_qid.get(i, []), spec[4]) for i, spec in enumerate(specs)]
+
+    @staticmethod
+    def _shape(rows: List[Dict], metrics: Sequence[str]) -> Dict:
         # normaliza salida a { first_period: {...}, second_period: {...} }
-        result_map = { r["period"]: r for r in rows }
-        first  = result_map.get("first",  {})
-        second = result_map.get("second", {})
+        first = second = None
+        for r in rows:
+            if r["period"] == "first": first = r
+            elif r["period"] == "second": second = r
 
-        # si metrics != ['all'], filtra llaves
-        def filter_metrics(d: Dict):
+        # si metrics != ['all'], filtra llaves; se recorre la lista pedida (corta) y no la fila,
+        # asi el orden de salida es estable: period primero y luego las metricas en el orden pedido
+        keep = None if len(metrics) == 1 and metrics[0] == "all" else tuple(dict.fromkeys(("period", *metrics)))
+        def filter_metrics(d: Dict | None):
             if not d: return {}
-            if metrics == ["all"]:
+            if keep is None:
                 return d
-            keep = set(["period"] + metrics)
-            return {k:v for k,v in d.items() if k in keep}
+            return {k: d[k] for k in keep if k in d}
 
         return {
             "first_period": filter_metrics(first),
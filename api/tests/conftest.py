@@ -0,0 +1,77 @@
+import os
+import sys
+from datetime import date, timedelta
+
+# Modules import each other relative to api/ (the uvicorn working directory)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data import bq_pool  # noqa: E402
+
+
+def _as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+class StubRow(dict):
+    """Dict with the Row.items() interface the repository reads."""
+
+
+class StubJob:
+    job_id = "stub-job"
+    cache_hit = False
+
+    def __init__(self, rows):
+        self._rows = rows
+
+    def result(self):
+        return self._rows
+
+
+class StubBigQueryClient:
+    """
+    Answers BigQueryRepository.compare_periods_many by evaluating its query semantics in Python
+    over an in-memory daily table {date: (spend, conversions)}; records every call.
+    """
+
+    def __init__(self, daily):
+        self.daily = daily
+        self.calls = []
+
+    def query(self, sql, job_config=None, job_id_prefix=None, location=None):
+        self.calls.append((sql, job_config, job_id_prefix, location))
+        params = {
+            p.name: [_as_date(v) for v in p.values] if hasattr(p, "values") else _as_date(p.value)
+            for p in job_config.query_parameters
+        }
+        specs = zip(params["first_starts"], params["first_ends"], params["second_starts"], params["second_ends"])
+        rows = []
+        for qid, (fs, fe, ss, se) in enumerate(specs):
+            totals = {}
+            for dt, (spend, conv) in self.daily.items():
+                if not params["range_start"] <= dt <= params["range_end"]:
+                    continue
+                if fs <= dt <= fe:
+                    period = "first"
+                elif ss <= dt <= se:
+                    period = "second"
+                else:
+                    continue
+                t = totals.setdefault(period, [0.0, 0, 0.0])
+                t[0] += spend
+                t[1] += conv
+                t[2] += conv * 100
+            for period, (spend, conv, revenue) in totals.items():
+                rows.append(StubRow(
+                    qid=qid, period=period, spend=spend, conversions=conv, revenue=revenue,
+                    CAC=spend / conv if conv else None, ROAS=revenue / spend if spend else None,
+                ))
+        return StubJob(rows)
+
+
+def daily_table(start: date, end: date, spend: float, conversions: int) -> dict:
+    days = (end - start).days + 1
+    return {start + timedelta(days=i): (spend, conversions) for i in range(days)}
+
+
+# routers build their MetricsService at import; keep that off real credentials
+bq_pool._client = StubBigQueryClient({})
@@ -0,0 +1,61 @@
+from datetime import date
+
+from conftest import StubBigQueryClient, daily_table
+from data.bq_repository import BigQueryRepository
+
+# May: 10 spend / 1 conversion per day; June: 20 spend / 2 conversions per day
+DAILY = {
+    **daily_table(date(2025, 5, 1), date(2025, 5, 31), 10.0, 1),
+    **daily_table(date(2025, 6, 1), date(2025, 6, 30), 20.0, 2),
+}
+
+
+def _by_qid(rows):
+    out = {}
+    for r in rows:
+        out.setdefault(r["qid"], {})[r["period"]] = r
+    return out
+
+
+def test_compare_periods_many_empty_specs_skips_query():
+    client = StubBigQueryClient(DAILY)
+    assert BigQueryRepository(client=client).compare_periods_many([]) == []
+    assert client.calls == []
+
+
+def test_compare_periods_many_inverted_spec_keeps_both_periods():
+    client = StubBigQueryClient(DAILY)
+    rows = BigQueryRepository(client=client).compare_periods_many([
+        ("2025-06-01", "2025-06-30", "2025-05-01", "2025-05-31"),  # "june vs may"
+    ])
+    periods = _by_qid(rows)[0]
+    assert periods["first"]["spend"] == 600.0
+    assert periods["second"]["spend"] == 310.0
+
+    params = {p.name: p for p in client.calls[0][1].query_parameters}
+    assert str(params["range_start"].value) == "2025-05-01"
+    assert str(params["range_end"].value) == "2025-06-30"
+
+
+def test_compare_periods_many_overlap_counts_toward_first():
+    client = StubBigQueryClient(DAILY)
+    rows = BigQueryRepository(client=client).compare_periods_many([
+        ("2025-05-01", "2025-05-20", "2025-05-10", "2025-05-31"),
+    ])
+    periods = _by_qid(rows)[0]
+    assert periods["first"]["spend"] == 200.0
+    assert periods["second"]["spend"] == 110.0
+
+
+def test_compare_periods_many_reassembles_by_qid():
+    client = StubBigQueryClient(DAILY)
+    rows = BigQueryRepository(client=client).compare_periods_many([
+        ("2025-05-01", "2025-05-31", "2025-06-01", "2025-06-30"),
+        ("2025-06-01", "2025-06-30", "2025-05-01", "2025-05-31"),
+        ("2024-01-01", "2024-01-31", "2024-02-01", "2024-02-29"),  # no data
+    ])
+    by_qid = _by_qid(rows)
+    assert len(client.calls) == 1
+    assert by_qid[0]["first"]["spend"] == by_qid[1]["second"]["spend"] == 310.0
+    assert by_qid[0]["second"]["spend"] == by_qid[1]["first"]["spend"] == 600.0
+    assert 2 not in by_qid
@@ -0,0 +1,66 @@
+from datetime import date
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from conftest import StubBigQueryClient, daily_table
+from data.bq_repository import BigQueryRepository
+from domain.nlq_mapper import NaturalLanguageToAPI
+from routers import nlq
+from services.metrics_service import MetricsService
+
+DAILY = {
+    **daily_table(date(2025, 5, 1), date(2025, 5, 31), 10.0, 1),
+    **daily_table(date(2025, 6, 1), date(2025, 6, 30), 20.0, 2),
+}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    bq = StubBigQueryClient(DAILY)
+    monkeypatch.setattr(nlq, "nl", NaturalLanguageToAPI(tz_today=date(2025, 7, 15)))
+    monkeypatch.setattr(nlq, "svc", MetricsService(BigQueryRepository(client=bq)))
+    app = FastAPI()
+    app.include_router(nlq.router)
+    with TestClient(app) as c:
+        c.bq = bq
+        yield c
+
+
+def test_parse_batch_runs_one_job_and_keeps_request_order(client):
+    r = client.post("/nlq/parse-batch", json=[
+        {"question": "ROAS june vs may"},
+        {"question": "hello"},
+        {"question": "CAC may vs june", "execute": False},
+        {"question": "CAC may vs june"},
+    ])
+    assert r.status_code == 200
+    june_vs_may, unparsed, dry_run, may_vs_june = r.json()
+    assert len(client.bq.calls) == 1
+
+    assert june_vs_may["ranges"]["first_start"] == "2025-06-01"
+    assert june_vs_may["result"] == {
+        "first_period": {"period": "first", "ROAS": 10.0},
+        "second_period": {"period": "second", "ROAS": 10.0},
+    }
+    assert "error" in unparsed
+    assert "result" not in dry_run
+    assert dry_run["suggested_url"].endswith(
+        "first_start=2025-05-01&first_end=2025-05-31&second_start=2025-06-01&second_end=2025-06-30"
+    )
+    assert may_vs_june["result"] == {
+        "first_period": {"period": "first", "CAC": 10.0},
+        "second_period": {"period": "second", "CAC": 10.0},
+    }
+
+
+def test_parse_batch_without_executions_skips_bigquery(client):
+    r = client.post("/nlq/parse-batch", json=[{"question": "CAC may vs june", "execute": False}])
+    assert r.status_code == 200
+    assert client.bq.calls == []
+
+
+def test_parse_batch_rejects_oversized_batches(client):
+    r = client.post("/nlq/parse-batch", json=[{"question": "CAC may vs june"}] * (nlq.MAX_BATCH_SIZE + 1))
+    assert r.status_code == 400
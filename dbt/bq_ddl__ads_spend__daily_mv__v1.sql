@@ -0,0 +1,15 @@
+-- Materialized daily rollup of ads_spend_raw
+-- The API compares periods at day grain, so it reads this view instead of re-aggregating the raw table.
+-- BigQuery refreshes the view incrementally as new rows land in ads_spend_raw (default refresh settings).
+-- Partitioned on the same column as the base table (see bq_ddl__ads_spend__raw_partitioned__v1.sql).
+CREATE MATERIALIZED VIEW IF NOT EXISTS `n8n-ads-spend.ads_warehouse.ads_spend_daily_mv`
+PARTITION BY dt
+AS
+SELECT
+  date AS dt,                           -- Day grain used by every period comparison
+  SUM(spend) AS spend,
+  SUM(conversions) AS conversions,
+  SUM(conversions * 100) AS revenue     -- Revenue assumption: $100 per conversion (raw table has no revenue column);
+                                        -- kept inside SUM because materialized views reject expressions over aggregates
+FROM `n8n-ads-spend.ads_warehouse.ads_spend_raw`
+GROUP BY dt;
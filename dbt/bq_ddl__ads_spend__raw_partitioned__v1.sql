@@ -0,0 +1,12 @@
+-- Rebuild ads_spend_raw partitioned by day and clustered by platform/account
+-- Every API query filters on a date range, so partition pruning limits the scan to the requested days.
+-- Run once, before creating ads_spend_daily_mv (the view is bound to this table).
+CREATE TABLE `n8n-ads-spend.ads_warehouse.ads_spend_raw_v2`
+PARTITION BY date                       -- date is already a DATE column, no DATE(...) wrapper needed
+CLUSTER BY platform, account
+AS
+SELECT * FROM `n8n-ads-spend.ads_warehouse.ads_spend_raw`;
+
+-- Swap the partitioned copy in under the original name
+DROP TABLE `n8n-ads-spend.ads_warehouse.ads_spend_raw`;
+ALTER TABLE `n8n-ads-spend.ads_warehouse.ads_spend_raw_v2` RENAME TO ads_spend_raw;
@@ -1,13 +1,12 @@
 WITH base AS (
-  --CTE 1: base - Aggregate daily spend and conversions
-  --This is the foundational data layer where we roll up metrics to date level
+  --CTE 1: base - Daily spend and conversions
+  --Read from the materialized daily rollup (bq_ddl__ads_spend__daily_mv__v1.sql), already one row per date
   SELECT
-    DATE(date) AS dt,  --Ensure consistent date format, time is truncated
-    SUM(spend) AS spend,
-    SUM(conversions) AS conv
-  FROM `n8n-ads-spend.ads_warehouse.ads_spend_raw`
-  WHERE DATE(date) BETWEEN '2025-05-01' AND '2025-06-30'
-  GROUP BY dt  -- Daily aggregation level
+    dt,
+    spend,
+    conversions AS conv
+  FROM `n8n-ads-spend.ads_warehouse.ads_spend_daily_mv`
+  WHERE dt BETWEEN '2025-05-01' AND '2025-06-30'  -- Filters the partition column, so only these days are read
 ),
 agg AS (
   -- CTE 2: agg - Roll up daily data to period level (prev vs last)
@@ -15,8 +14,7 @@ agg AS (
   SELECT
     -- FIXED LOGIC: Categorize dates into comparison periods
     -- Uses hardcoded dates because CURRENT_DATE() cannot be trusted in this dataset
-    CASE WHEN dt >= '2025-06-01' THEN 'last_period'  -- June 2025
-         ELSE 'prev_period' END AS period,           -- May 2025
+    IF(dt >= '2025-06-01', 'last_period', 'prev_period') AS period,  -- June 2025 vs May 2025
     SUM(spend) AS spend,        -- Total spend for period
     SUM(conv) AS conv           -- Total conversions for period
   FROM base
@@ -38,9 +36,9 @@ filled AS (
     IFNULL(a.conv, 0) AS conv,             -- Handle missing data as 0
     IFNULL(a.conv, 0) * 100 AS revenue,    -- Revenue assumption: $100 per conversion
     -- CAC calculation: Cost per Acquisition with division protection
-    SAFE_DIVIDE(IFNULL(a.spend, 0), NULLIF(IFNULL(a.conv, 0), 0)) AS CAC,
+    SAFE_DIVIDE(IFNULL(a.spend, 0), IFNULL(a.conv, 0)) AS CAC,
     -- ROAS calculation: Return on Ad Spend with division protection
-    SAFE_DIVIDE(IFNULL(a.conv, 0) * 100, NULLIF(IFNULL(a.spend, 0), 0)) AS ROAS
+    SAFE_DIVIDE(IFNULL(a.conv, 0) * 100, IFNULL(a.spend, 0)) AS ROAS
   FROM periods p
   LEFT JOIN agg a USING (period)  -- Preserve all periods from CTE
 ),
@@ -77,9 +75,9 @@ SELECT
   ROUND(ROAS_prev, 2) AS ROAS_prev,    -- Rounded for readability
   -- Percentage Deltas (period-over-period change)
   -- All calculations use SAFE_DIVIDE to handle division by zero
-  ROUND(SAFE_DIVIDE(spend_last - spend_prev, NULLIF(spend_prev, 0)) * 100, 2) AS spend_delta_pct,
-  ROUND(SAFE_DIVIDE(conv_last - conv_prev, NULLIF(conv_prev, 0)) * 100, 2) AS conversions_delta_pct,
-  ROUND(SAFE_DIVIDE(revenue_last - revenue_prev, NULLIF(revenue_prev, 0)) * 100, 2) AS revenue_delta_pct,
-  ROUND(SAFE_DIVIDE(CAC_last - CAC_prev, NULLIF(CAC_prev, 0)) * 100, 2) AS CAC_delta_pct,
-  ROUND(SAFE_DIVIDE(ROAS_last - ROAS_prev, NULLIF(ROAS_prev, 0)) * 100, 2) AS ROAS_delta_pct
+  ROUND(SAFE_DIVIDE(spend_last - spend_prev, spend_prev) * 100, 2) AS spend_delta_pct,
+  ROUND(SAFE_DIVIDE(conv_last - conv_prev, conv_prev) * 100, 2) AS conversions_delta_pct,
+  ROUND(SAFE_DIVIDE(revenue_last - revenue_prev, revenue_prev) * 100, 2) AS revenue_delta_pct,
+  ROUND(SAFE_DIVIDE(CAC_last - CAC_prev, CAC_prev) * 100, 2) AS CAC_delta_pct,
+  ROUND(SAFE_DIVIDE(ROAS_last - ROAS_prev, ROAS_prev) * 100, 2) AS ROAS_delta_pct
 FROM pivoted;
\ No newline at end of file